@@ -1,6 +1,8 @@
 """Download 3D model from Objaverse."""
 import argparse
+import concurrent.futures
 import os
+from typing import Dict, List
 
 import objaverse
 
@@ -16,12 +18,38 @@ def parse_args() -> argparse.Namespace:
                         help='Output directory')
     parser.add_argument('--uids', type=str, nargs='+', required=True,
                         help='Objaverse UID')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Number of parallel download workers (default: one per UID, capped at 16)')
     return parser.parse_args()
 
 
+def download_objects(uids: List[str], processes: int) -> Dict[str, str]:
+    """Download the given UIDs with parallel fetches.
+
+    Args:
+        uids: Objaverse UIDs to download.
+        processes: Number of parallel download workers.
+
+    Returns:
+        Mapping of UID to local file path.
+    """
+    try:
+        return objaverse.load_objects(uids=uids, download_processes=processes)
+    except TypeError:
+        # older objaverse versions download serially; threads suffice here
+        # since urllib releases the GIL during socket reads
+        objects = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(objaverse.load_objects, uids=[uid]) for uid in uids]
+            for future in concurrent.futures.as_completed(futures):
+                objects.update(future.result())
+        return objects
+
+
 if __name__ == '__main__':
     args = parse_args()
     objaverse.BASE_PATH = args.base_path
     objaverse._VERSIONED_PATH = os.path.join(objaverse.BASE_PATH, "hf-objaverse-v1")
-    objects = objaverse.load_objects(uids=args.uids)
+    processes = args.processes if args.processes else min(len(args.uids), 16)
+    objects = download_objects(args.uids, processes)
     print(objects)
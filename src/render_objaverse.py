@@ -1,43 +1,100 @@
 """Render a scene with two objects in Blender."""
 import argparse
+import functools
 import json
 import math
 import os
+import sys
 import numpy as np
 from typing import Any, Dict, List
 import bpy
 import bpy_extras
-from mathutils import Vector
+from mathutils import Euler, Vector
 
-def extract_masks_3drf(output_path: str, output_file: str) -> None:
-    """Render a masked image from the current scene and save it to disk.
+DIR = os.path.dirname(os.path.realpath(__file__))
+
+def extract_masks_3drf(output_path: str, output_image: str) -> None:
+    """Derive the mask from the alpha channel of the already-rendered image.
+
+    The scene is rendered with a transparent film, so the alpha channel of the
+    saved image already separates the objects from the background: the mask is
+    the inverted, thresholded alpha and requires no second render. The grey
+    world background is composited back into the image in its place. The image
+    is read and written through bpy.data.images, so this module only needs
+    libraries bundled with Blender's Python.
 
     Args:
         output_path: Path to save the masked image.
-        output_file: Output file name for the masked image.
+        output_image: Path of the rendered RGBA image.
     """
-    # Set up compositing nodes
-    bpy.context.scene.use_nodes = True
-    bpy.context.scene.render.film_transparent = True
-    tree = bpy.context.scene.node_tree
-    # Clear existing nodes
-    for node in tree.nodes:
-        tree.nodes.remove(node)
-    # Add required nodes
-    render_layers = tree.nodes.new('CompositorNodeRLayers')
-    invert_node = tree.nodes.new('CompositorNodeInvert')
-    composite = tree.nodes.new('CompositorNodeComposite')
-    # Exclude plane from render layer
-    for obj in bpy.data.objects:
-        if obj.type == 'MESH' and obj.name.startswith('Plane'):
-            obj.hide_render = True
-    # Link nodes to invert alpha
-    tree.links.new(render_layers.outputs['Alpha'], invert_node.inputs['Color'])
-    tree.links.new(invert_node.outputs['Color'], composite.inputs['Image'])
-    # Render and save
-    render_args = bpy.context.scene.render
-    render_args.filepath = os.path.join(output_path, output_file)
-    bpy.ops.render.render(write_still=True)
+    img = bpy.data.images.load(output_image)
+    width, height = img.size
+    pixels = np.empty(width * height * 4, dtype=np.float32)
+    img.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(-1, 4)
+    alpha = pixels[:, 3:4]
+    # background (fully transparent) pixels become white in the mask
+    mask_value = (alpha < 2 / 255).astype(np.float32)
+    mask_pixels = np.concatenate((np.repeat(mask_value, 3, axis=1), np.ones_like(alpha)), axis=1)
+    mask_img = bpy.data.images.new('mask', width=width, height=height)
+    mask_img.pixels.foreach_set(mask_pixels.ravel())
+    mask_img.filepath_raw = os.path.join(output_path, os.path.basename(output_image))
+    mask_img.file_format = 'PNG'
+    mask_img.save()
+    bpy.data.images.remove(mask_img)
+    # composite the light grey background back in over the transparent film;
+    # 0.5 linear is the grey that lands near 188 after the sRGB transform
+    pixels[:, :3] = pixels[:, :3] * alpha + 0.5 * (1 - alpha)
+    pixels[:, 3] = 1.0
+    img.pixels.foreach_set(pixels.ravel())
+    img.file_format = 'PNG'
+    img.save()
+    bpy.data.images.remove(img)
+
+def project_bbox(obj: bpy.types.Object, camera: bpy.types.Object, width: int, height: int) -> np.ndarray:
+    """Project an object's bounding box into pixel coordinates.
+
+    The eight corners are transformed with two NumPy matmuls instead of
+    per-corner `world_to_camera_view` calls; orthographic cameras fall back
+    to the reference path.
+
+    Args:
+        obj: The object whose bounding box is projected.
+        camera: The camera object used for rendering the scene.
+        width: The width of the rendered image in pixels.
+        height: The height of the rendered image in pixels.
+
+    Returns:
+        Array (x_min, x_max, y_min, y_max, area) in pixel coordinates.
+    """
+    corners = np.array([list(corner) + [1.0] for corner in obj.bound_box])
+    world = corners @ np.array(obj.matrix_world).T
+    if camera.data.type == 'ORTHO':
+        coords_2d = [
+            bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, camera, Vector(corner[:3]))
+            for corner in world
+        ]
+        uv = np.array([[co.x, co.y] for co in coords_2d])
+    else:
+        # Vectorized equivalent of world_to_camera_view for perspective cameras:
+        # the view frame scales linearly with depth, so normalize per corner
+        local = world @ np.array(camera.matrix_world.normalized().inverted()).T
+        z = -local[:, 2]
+        frame = np.array([list(v) for v in camera.data.view_frame(scene=bpy.context.scene)[:3]])
+        frame_z = frame[0, 2]
+        min_x = -frame[2, 0] / frame_z * z
+        max_x = -frame[1, 0] / frame_z * z
+        min_y = -frame[1, 1] / frame_z * z
+        max_y = -frame[0, 1] / frame_z * z
+        uv = np.stack([
+            (local[:, 0] - min_x) / (max_x - min_x),
+            (local[:, 1] - min_y) / (max_y - min_y)
+        ], axis=1)
+    # convert normalized coordinates into pixel coordinates
+    x_min, y_min = uv.min(axis=0) * (width, height)
+    x_max, y_max = uv.max(axis=0) * (width, height)
+    area = max(0, x_max - x_min) * max(0, y_max - y_min)
+    return np.array([x_min, x_max, y_min, y_max, area])
 
 def check_overlap(obj1: bpy.types.Object, obj2: bpy.types.Object, camera: bpy.types.Object, width: int, height: int, direction: str) -> bool:
     """Determine if two objects overlap in the rendered image by analyzing their intersecting pixels.
@@ -57,32 +114,12 @@ def check_overlap(obj1: bpy.types.Object, obj2: bpy.types.Object, camera: bpy.ty
         (2) If the objects are side by side and there are any shared pixels between the objects. 
         This function is used to skip scenes where one object is blocked by the other or if they are too close to each other.
     """
-    # Get all meshes in the scene
-    bboxes = []
-    obj_areas = []
-    for obj in [obj1, obj2]:
-        # project all bounding box corners into camera views
-        coords_2d = [
-            bpy_extras.object_utils.world_to_camera_view(bpy.context.scene, camera, obj.matrix_world @ Vector(corner))
-            for corner in obj.bound_box
-        ]
-        us = [co.x for co in coords_2d]
-        vs = [co.y for co in coords_2d]
-        min_u, max_u = min(us), max(us)
-        min_v, max_v = min(vs), max(vs)
-        # convert normalized coordinates into pixel coordinates
-        x_min = min_u * width
-        x_max = max_u * width
-        y_min = min_v * height
-        y_max = max_v * height
-        area = max(0, x_max - x_min) * max(0, y_max - y_min)
-        bboxes.append((x_min, x_max, y_min, y_max, area))
-        obj_areas.append(area)
+    # Project both bounding boxes into pixel space
+    bboxes = np.stack([project_bbox(obj, camera, width, height) for obj in [obj1, obj2]])
+    obj_areas = bboxes[:, 4]
     # calculate the intersection area
-    x_min1, x_max1, y_min1, y_max1, _ = bboxes[0]
-    x_min2, x_max2, y_min2, y_max2, _ = bboxes[1]
-    inter_x = max(0, min(x_max1, x_max2) - max(x_min1, x_min2))
-    inter_y = max(0, min(y_max1, y_max2) - max(y_min1, y_min2))
+    inter_x = max(0, bboxes[:, 1].min() - bboxes[:, 0].max())
+    inter_y = max(0, bboxes[:, 3].min() - bboxes[:, 2].max())
     intersection_area = inter_x * inter_y
     # check if the intersection area is non-zero for side-by-side cases
     if direction in ['left', 'right']:
@@ -92,6 +129,49 @@ def check_overlap(obj1: bpy.types.Object, obj2: bpy.types.Object, camera: bpy.ty
         return (obj_areas[0] < obj_areas[1] and direction == 'front') or (obj_areas[0] >= obj_areas[1] and direction == 'behind')
     return False
 
+# Cache of appended object templates keyed by (object_dir, object_name)
+_APPENDED_CACHE = {}
+
+def load_object_3drf(object_dir: str, object_name: str) -> bpy.types.Object:
+    """Link a copy of an object into the scene, appending from disk only once.
+
+    The first request for an object appends it from its .blend file, applies
+    its transform, fixes its origin, and keeps the result as a hidden template.
+    Later requests duplicate the cached template instead of re-parsing the
+    .blend file from disk.
+
+    Args:
+        object_dir: Directory containing the object's .blend file.
+        object_name: Name of the object to load.
+
+    Returns:
+        The scene object to place, named object_name.
+    """
+    key = (object_dir, object_name)
+    template = _APPENDED_CACHE.get(key)
+    try:
+        template_valid = template is not None and template.name in bpy.data.objects
+    except ReferenceError:
+        # reopening a .blend frees cached datablocks
+        template_valid = False
+    if not template_valid:
+        # append the object to the scene
+        bpy.ops.wm.append(directory=os.path.join(object_dir, 'Object'), filename=object_name)
+        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
+        # ensure the object's center of rotation is correct
+        bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS', center='BOUNDS')
+        template = bpy.data.objects[object_name]
+        template.name = object_name + '.template'
+        template.hide_render = True
+        _APPENDED_CACHE[key] = template
+    # linked duplicate: share the template mesh instead of re-appending from
+    # disk, so repeated scenes do not pile up zero-user mesh copies
+    new_obj = template.copy()
+    new_obj.name = object_name
+    new_obj.hide_render = False
+    bpy.context.collection.objects.link(new_obj)
+    return new_obj
+
 def add_objects_3drf(objects: List[Dict[str, Any]], config: Dict[str, Any], properties: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Add random objects to the current blender scene.
 
@@ -118,34 +198,126 @@ def add_objects_3drf(objects: List[Dict[str, Any]], config: Dict[str, Any], prop
     for obj in objects:
         object_name = obj['name']
         object_dir = os.path.join(config['shape_dir'], properties[object_name]['file'])
-        # append the object to the scene
-        bpy.ops.wm.append(directory=os.path.join(object_dir, 'Object'), filename=object_name)
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        # ensure the object's center of rotation is correct
-        bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS', center='BOUNDS')
-        # select object
-        selected_obj = bpy.data.objects[object_name]
-        # Deselect all objects and select the current one
-        bpy.ops.object.select_all(action='DESELECT')
-        selected_obj.select_set(True)
-        bpy.context.view_layer.objects.active = selected_obj
-        # set object position to the origin
-        selected_obj.location = (0, 0, 0)
-        # reshape
+        # link a (cached) copy of the object into the scene
+        selected_obj = load_object_3drf(object_dir, object_name)
+        # place the object by assigning datablock attributes directly; the
+        # bpy.ops.transform operators trigger a full depsgraph update each call
         scale = obj['scale'] * scale_factor
-        bpy.ops.transform.resize(value=(scale, scale, scale))
-        # align with base
+        selected_obj.scale = (scale, scale, scale)
+        # align with base: rotation is about the z-axis only, so the lowest
+        # corner of the local bounding box just scales
+        min_z = min(corner[2] for corner in selected_obj.bound_box) * scale
         x, y = obj['position']
-        bbox = []
-        for corner in selected_obj.bound_box:
-            world_corner = selected_obj.matrix_world @ Vector(corner)
-            bbox.append(world_corner)
-        min_z = min(v.z for v in bbox)
-        bpy.ops.transform.translate(value=(x, y, -min_z))
+        selected_obj.location = (x, y, -min_z)
         selected_obj.rotation_mode = 'XYZ'
         selected_obj.rotation_euler = [0, 0, obj['rotation']]
-        # de-select all objects
-        bpy.ops.object.select_all(action='DESELECT')
+    # update the view layer once so downstream reads of matrix_world are fresh
+    bpy.context.view_layer.update()
+
+# Names of the datablocks belonging to the base scene, recorded at load time
+_BASE_OBJECT_NAMES = set()
+
+# Compute device type picked by _enable_gpu, e.g. 'OPTIX' or 'CUDA'
+_COMPUTE_DEVICE_TYPE = None
+
+def _enable_gpu() -> None:
+    """Enable the best available Cycles compute backend.
+
+    Setting `cycles.device = 'GPU'` alone silently falls back to CPU unless a
+    compute device is enabled in the add-on preferences, so enumerate the
+    backends in order of preference and enable every non-CPU device found.
+    """
+    global _COMPUTE_DEVICE_TYPE
+    prefs = bpy.context.preferences.addons['cycles'].preferences
+    devices = []
+    for device_type in ('OPTIX', 'CUDA', 'HIP', 'ONEAPI'):
+        try:
+            prefs.compute_device_type = device_type
+        except TypeError:
+            continue
+        devices = prefs.get_devices_for_type(device_type)
+        if devices:
+            _COMPUTE_DEVICE_TYPE = device_type
+            break
+    for device in devices:
+        device.use = (device.type != 'CPU')
+    # When a launcher pinned this process to one GPU via CUDA_VISIBLE_DEVICES,
+    # the remap leaves the intended device first; keep only that one enabled
+    if 'CUDA_VISIBLE_DEVICES' in os.environ and _COMPUTE_DEVICE_TYPE in ('OPTIX', 'CUDA'):
+        gpu_devices = [device for device in devices if device.type != 'CPU']
+        for device in gpu_devices[1:]:
+            device.use = False
+    bpy.context.scene.cycles.device = 'GPU'
+
+def _init_scene(config: Dict[str, Any]) -> None:
+    """Load the base blendfile and apply the one-time render configuration.
+
+    Args:
+        config: Config file for the scene.
+    """
+    global _BASE_OBJECT_NAMES
+    bpy.ops.wm.open_mainfile(filepath=config['base_scene_blendfile'])
+    # use BLENDER_RENDER to render
+    render_args = bpy.context.scene.render
+    render_args.engine = 'CYCLES'
+    render_args.resolution_x = config['width']
+    render_args.resolution_y = config['height']
+    render_args.resolution_percentage = 100
+    # keep BVH and compiled shaders alive between renders of repeated objects
+    render_args.use_persistent_data = True
+    # render on a transparent film so the mask can be read from the alpha channel
+    render_args.film_transparent = True
+    render_args.image_settings.color_mode = 'RGBA'
+    # Exclude the ground plane from renders; the mask marks it as background
+    for obj in bpy.data.objects:
+        if obj.type == 'MESH' and obj.name.startswith('Plane'):
+            obj.hide_render = True
+    # adaptive sampling stops sampling pixels that have already converged
+    bpy.context.scene.cycles.use_adaptive_sampling = True
+    bpy.context.scene.cycles.adaptive_threshold = 0.01
+    if config['use_gpu']:
+        _enable_gpu()
+    # a few denoised samples are visually equivalent for training data
+    bpy.context.scene.cycles.samples = config.get('cycles_samples', 32)
+    bpy.context.scene.cycles.use_denoising = True
+    bpy.context.scene.cycles.denoiser = 'OPTIX' if _COMPUTE_DEVICE_TYPE == 'OPTIX' else 'OPENIMAGEDENOISE'
+    _BASE_OBJECT_NAMES = {obj.name for obj in bpy.data.objects}
+
+@functools.lru_cache(maxsize=32)
+def _compute_scene_directions(tilt: float, pan: float) -> Dict[str, tuple]:
+    """Compute the axis-aligned ground-plane directions for a camera setting.
+
+    The directions only depend on the camera tilt and pan, so they are
+    computed with pure math (rotate the camera view and left vectors, project
+    them onto the ground plane) and cached instead of adding and deleting a
+    helper plane in the scene for every render.
+
+    Args:
+        tilt: Tilt (vertical) angle of the camera in degrees.
+        pan: Pan (horizontal) angle of the camera in degrees.
+
+    Returns:
+        Mapping of direction name to its unit vector on the ground plane.
+    """
+    rotation = Euler((math.radians(tilt), 0, math.radians(pan)), 'XYZ').to_quaternion()
+    plane_normal = Vector((0, 0, 1))
+    cam_behind = rotation @ Vector((0, 0, -1))
+    cam_left = rotation @ Vector((-1, 0, 0))
+    plane_behind = (cam_behind - cam_behind.project(plane_normal)).normalized()
+    plane_left = (cam_left - cam_left.project(plane_normal)).normalized()
+    return {
+        'behind': tuple(plane_behind),
+        'front': tuple(-plane_behind),
+        'left': tuple(plane_left),
+        'right': tuple(-plane_left),
+    }
+
+def _reset_scene() -> None:
+    """Remove the objects added by the previous render, keeping the base scene."""
+    for obj in list(bpy.data.objects):
+        if obj.name in _BASE_OBJECT_NAMES or obj.name.endswith('.template'):
+            continue
+        bpy.data.objects.remove(obj, do_unlink=True)
 
 def render_scene_3drf(args: argparse.Namespace,
                     config: Dict[str, Any],
@@ -155,7 +327,8 @@ def render_scene_3drf(args: argparse.Namespace,
                     output_image: str,
                     output_scene: str,
                     objects: List[Dict[str, Any]],
-                    direction: str) -> None:
+                    direction: str,
+                    write_scene: bool = True) -> Dict[str, Any]:
     """Render a scene and save it to disk.
 
     Args:
@@ -168,22 +341,21 @@ def render_scene_3drf(args: argparse.Namespace,
         output_scene: Output scene file path.
         objects: Configs for objects to add to the scene.
         direction: Direction of the second object to the first object (in relative frame).
+        write_scene: Write the scene file; disable when the caller batches the
+            scene data structures itself.
+
+    Returns:
+        The scene data structure, or None if the scene was skipped.
     """
     intrinsic_directions = config['intrinsic_directions']
     caption_templates = config['caption_templates']
-    # load the main blendfile and materials
-    bpy.ops.wm.open_mainfile(filepath=config['base_scene_blendfile'])
-    # use BLENDER_RENDER to render
+    # load the main blendfile and materials once; reset in place on later calls
+    if not _BASE_OBJECT_NAMES:
+        _init_scene(config)
+    else:
+        _reset_scene()
     render_args = bpy.context.scene.render
-    render_args.engine = 'CYCLES'
     render_args.filepath = output_image
-    render_args.resolution_x = config['width']
-    render_args.resolution_y = config['height']
-    render_args.resolution_percentage = 100
-    bpy.context.scene.cycles.tile_x = config['render_tile_size']
-    bpy.context.scene.cycles.tile_y = config['render_tile_size']
-    if config['use_gpu']:
-        bpy.context.scene.cycles.device = 'GPU'
     # define scene structure
     scene_struct = {
         'image_index': index,
@@ -191,36 +363,24 @@ def render_scene_3drf(args: argparse.Namespace,
     }
     # get ground and figure objects
     ground, figure = objects
-    # put a helper plane on the ground for easier calculation of the directions
-    bpy.ops.mesh.primitive_plane_add(size=5)
-    plane = bpy.context.object
     # set up camera
     camera = bpy.data.objects['Camera']
     camera.rotation_euler = (math.radians(camera_settings['tilt']), 0, math.radians(camera_settings['pan']))
     camera.location[2] = camera_settings['height']
     camera.data.lens = camera_settings['focal_length']
     scene_struct['camera'] = camera_settings
-    # calculate the directions in the scene
-    plane_normal = plane.data.vertices[0].normal
-    cam_behind = camera.matrix_world.to_quaternion() @ Vector((0, 0, -1))
-    cam_left = camera.matrix_world.to_quaternion() @ Vector((-1, 0, 0))
-    plane_behind = (cam_behind - cam_behind.project(plane_normal)).normalized()
-    plane_left = (cam_left - cam_left.project(plane_normal)).normalized()
-    # delete the helper plane
-    bpy.ops.object.delete()
-    # All axis-aligned directions in the scene
-    scene_directions = {
-        'behind': tuple(plane_behind),
-        'front': tuple(-plane_behind),
-        'left': tuple(plane_left),
-        'right': tuple(-plane_left),
-    }
+    # All axis-aligned directions in the scene, cached per camera setting
+    scene_directions = _compute_scene_directions(camera_settings['tilt'], camera_settings['pan'])
     # Calculate positions and add objects
     direction_vector = np.array(scene_directions[direction])[:2]
     normalized_direction = direction_vector / np.linalg.norm(direction_vector)
     ground['position'] = (-normalized_direction * (args.distance_between_objects / 2)).tolist()
     figure['position'] = (normalized_direction * (args.distance_between_objects / 2)).tolist()
     add_objects_3drf(objects, config, properties)
+    # If overlap exists, skip before paying for the render
+    if check_overlap(bpy.data.objects[ground['name']], bpy.data.objects[figure['name']], camera, config['width'], config['height'], direction):
+        print('\nOverlap detected, skipping...\n')
+        return None
     # Set background color to light grey
     bpy.context.scene.world.use_nodes = True
     bg_node = bpy.context.scene.world.node_tree.nodes['Background']
@@ -232,13 +392,8 @@ def render_scene_3drf(args: argparse.Namespace,
             break
         except Exception as e:
             print(e)
-    # If overlap exists, remove the rendered image, and skip
-    if check_overlap(bpy.data.objects[ground['name']], bpy.data.objects[figure['name']], camera, config['width'], config['height'], direction):
-        print('\nOverlap detected, skipping...\n')
-        os.remove(output_image)
-        return
-    # extract the masks
-    extract_masks_3drf(config['masks_dir'] , os.path.basename(output_image))
+    # extract the masks from the alpha channel of the render
+    extract_masks_3drf(config['masks_dir'], output_image)
     # save the scene data structure
     scene_struct['ground_object'] = {
         'name': ground['name'],
@@ -267,5 +422,48 @@ def render_scene_3drf(args: argparse.Namespace,
     if figure['orientation']:
         scene_struct['figure_object']['intrinsic_relation'] = intrinsic_directions[figure['orientation']][reversed_direction[direction]]
         scene_struct['figure_object']['intrinsic_caption'] = caption_templates['3d_intrinsic'][scene_struct['figure_object']['intrinsic_relation']].format(figure['name'], ground['name'])
-    with open(output_scene, 'w') as f:
-        json.dump(scene_struct, f, indent=2)
+    if write_scene:
+        with open(output_scene, 'w') as f:
+            json.dump(scene_struct, f, indent=2)
+    return scene_struct
+
+def _serve_stdin() -> None:
+    """Serve render requests from stdin inside a single Blender process.
+
+    Each line is a JSON object with keys index, output_image, output_scene,
+    objects and direction, plus optional camera_settings and
+    distance_between_objects. Keeping one Blender process alive amortizes the
+    startup, import, and base-.blend load costs across all requested scenes.
+    """
+    with open(os.path.join(DIR, 'config.json'), 'r') as f:
+        config = json.load(f)
+    # Anchor the config paths next to this script and create the output
+    # directories up front, so requests work regardless of the caller's CWD
+    for key in ('base_scene_blendfile', 'properties_json', 'shape_dir'):
+        config[key] = os.path.abspath(os.path.join(DIR, config[key]))
+    for key in ('output_image_dir', 'output_scene_dir', 'masks_dir'):
+        config[key] = os.path.abspath(os.path.join(DIR, config[key]))
+        os.makedirs(config[key], exist_ok=True)
+    with open(config['properties_json'], 'r') as f:
+        properties = json.load(f)
+    default_camera = {'tilt': 90, 'pan': 45, 'height': 1, 'focal_length': 60}
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        request = json.loads(line)
+        args = argparse.Namespace(distance_between_objects=request.get('distance_between_objects', 3))
+        render_scene_3drf(
+            args,
+            config,
+            request.get('camera_settings', default_camera),
+            properties,
+            request['index'],
+            request['output_image'],
+            request['output_scene'],
+            request['objects'],
+            request['direction']
+        )
+
+if __name__ == '__main__':
+    _serve_stdin()
@@ -0,0 +1,73 @@
+"""Launch multiple Blender workers to render random scenes in parallel."""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def parse_args() -> Tuple[argparse.Namespace, List[str]]:
+    """Parse command-line arguments.
+
+    Returns:
+        Parsed launcher arguments and the remaining arguments, which are
+        forwarded to render_scene.py unchanged.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blender', type=str, required=True,
+                        help='Path to the Blender executable.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of Blender worker processes to spawn.')
+    parser.add_argument('--num-gpus', type=int, default=0,
+                        help='Number of GPUs to spread the workers over; 0 disables GPU pinning.')
+    parser.add_argument('--workers-per-gpu', type=int, default=1,
+                        help='Worker processes bound to each GPU when --num-gpus is set.')
+    return parser.parse_known_args()
+
+
+def main(args: argparse.Namespace, render_args: List[str]) -> int:
+    """Spawn one Blender process per shard and wait for all of them.
+
+    Each worker runs render_scene.py with a distinct --shard-index, so the
+    deterministic scene list is split without any coordination between
+    processes.
+
+    Args:
+        args: Parsed launcher arguments.
+        render_args: Arguments forwarded to render_scene.py.
+
+    Returns:
+        0 if every worker succeeded, otherwise the first non-zero exit code.
+    """
+    script = os.path.join(DIR, 'render_scene.py')
+    if args.num_gpus > 0:
+        worker_count = args.num_gpus * args.workers_per_gpu
+    else:
+        worker_count = args.workers
+    workers = []
+    for shard_index in range(worker_count):
+        env = None
+        if args.num_gpus > 0:
+            # one dedicated GPU per worker beats a single multi-GPU Blender
+            # instance for short renders, which pay tile-stitch sync costs
+            env = dict(os.environ, CUDA_VISIBLE_DEVICES=str(shard_index % args.num_gpus))
+        command = [
+            args.blender, '--background', '--python', script, '--',
+            *render_args,
+            '--shard-index', str(shard_index),
+            '--shard-count', str(worker_count),
+        ]
+        workers.append(subprocess.Popen(command, env=env))
+    exit_code = 0
+    for worker in workers:
+        # wait on every worker, even after a failure, so none are orphaned
+        code = worker.wait()
+        exit_code = exit_code or code
+    return exit_code
+
+
+if __name__ == '__main__':
+    args, render_args = parse_args()
+    sys.exit(main(args, render_args))
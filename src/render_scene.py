@@ -1,13 +1,13 @@
 """Render scenes with Blender."""
 import argparse
-import copy
+import functools
 import json
 import math
 import random
 import os
 import sys
+from itertools import combinations, islice, product
 from typing import Any, Dict, List, Mapping
-from render_objaverse import render_scene_3drf
 
 INSIDE_BLENDER = True
 try:
@@ -33,6 +33,8 @@ DIR = os.path.dirname(os.path.realpath(__file__))
 
 # List of directions
 directions = ['front', 'right', 'behind', 'left']
+# Index of each direction, for O(1) lookups in hot loops
+DIRECTION_INDEX = {d: i for i, d in enumerate(directions)}
 
 def parse_args(argv: str = None) -> argparse.Namespace:
     """Parse command-line arguments.
@@ -70,6 +72,14 @@ def parse_args(argv: str = None) -> argparse.Namespace:
                         help='Height (in meters) of the camera in the scene.')
     parser.add_argument('--camera-focal-length', type=float, default=None,
                         help='Focal length (in millimeters) of the camera lens.')
+    # output settings
+    parser.add_argument('--scene-batch', action='store_true', default=False,
+                        help='Write one buffered JSON-lines scene file per direction instead of one JSON file per image.')
+    # sharding settings (see render_parallel.py)
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='Index of this worker among --shard-count parallel workers.')
+    parser.add_argument('--shard-count', type=int, default=1,
+                        help='Total number of parallel workers rendering the scene list.')
     # return parsed arguments
     return parser.parse_args(argv)
 
@@ -82,20 +92,12 @@ def generate_camera_configs(max_configs: int) -> List[Dict[str, Any]]:
     Returns:
         A list of dictionaries with camera configurations.
     """
-    camera_configs = []
-    for tilt in [85, 90, 95]:
-        for pan in [40, 45, 50]:
-            for height in [0.5, 1, 1.5]:
-                for focal_length in [50, 60, 70]:
-                    camera_configs.append({
-                        'tilt': tilt,
-                        'pan': pan,
-                        'height': height,
-                        'focal_length': focal_length
-                    })
-    random.seed(42)
-    random.shuffle(camera_configs)
-    return camera_configs[:max_configs]
+    camera_configs = [
+        dict(zip(('tilt', 'pan', 'height', 'focal_length'), values))
+        for values in product([85, 90, 95], [40, 45, 50], [0.5, 1, 1.5], [50, 60, 70])
+    ]
+    # sample with a local Random so the module-wide seed state stays untouched
+    return random.Random(42).sample(camera_configs, min(max_configs, len(camera_configs)))
 
 def candidate_objects_with_rotations(obj: Mapping[str, Any]) -> List[Mapping[str, Any]]:
     """Generate candidate objects with rotations.
@@ -110,13 +112,14 @@ def candidate_objects_with_rotations(obj: Mapping[str, Any]) -> List[Mapping[str
     if default_orientation:
         ret_objs = list()
         for i, rotate_direction in enumerate([0, math.pi / 2, math.pi, 3 * math.pi / 2]):
-            ret_obj = copy.deepcopy(obj)
+            # only rotation and orientation are overridden, so a shallow copy suffices
+            ret_obj = dict(obj)
             ret_obj['rotation'] = rotate_direction
-            ret_obj['orientation'] = directions[(directions.index(default_orientation) + i) % 4]
+            ret_obj['orientation'] = directions[(DIRECTION_INDEX[default_orientation] + i) % 4]
             ret_objs.append(ret_obj)
         return ret_objs
     else:
-        ret_obj = copy.deepcopy(obj)
+        ret_obj = dict(obj)
         ret_obj['rotation'] = 0
         ret_obj['orientation'] = None
         return [ret_obj]
@@ -143,67 +146,89 @@ def render_random_scenes(args: argparse.Namespace,
     Returns:
         None
     """
+    # Imported lazily so `python render_scene.py --help` never loads bpy
+    from render_objaverse import render_scene_3drf
+    # Sort the objects so every shard derives the identical scene list
+    obj_names = sorted(obj_names)
+    # Compute the candidate rotations once per object rather than once per pair
+    rotations = {name: candidate_objects_with_rotations(properties[name]) for name in obj_names}
     # Generate all possible combinations of objects
     object_combinations = []
-    for i, obj_i in enumerate(obj_names):
-        for j, obj_j in enumerate(obj_names):
-            if i < j:
-                obj_i_with_rotation = candidate_objects_with_rotations(properties[obj_i])
-                obj_j_with_rotation = candidate_objects_with_rotations(properties[obj_j]) 
-                scene_combinations = []
-                # Create a shuffled list of direction combinations
-                for direction in directions:
-                    for obj_i_r in obj_i_with_rotation:
-                        for obj_j_r in obj_j_with_rotation:
-                            scene_combinations.append((obj_i_r, obj_j_r, direction))
-                scenes_by_directions = {}
-                for scene in scene_combinations:
-                    if scene[2] not in scenes_by_directions:
-                        scenes_by_directions[scene[2]] = []
-                    if len(scenes_by_directions[scene[2]]) < max_images:
-                        scenes_by_directions[scene[2]].append(scene)
-                filtered_scenes = []
-                for direction in directions:
-                    for scene in scenes_by_directions[direction]:
-                        for camera_config in camera_configs:
-                            filtered_scenes.append((*scene, camera_config))
-                object_combinations.append((obj_i, obj_j, filtered_scenes))
-    # Render scenes for each combination
-    image_count = 0
+    for obj_i, obj_j in combinations(obj_names, 2):
+        # Keep at most max_images rotation pairs per direction, built in a
+        # single pass without intermediate per-direction buckets
+        filtered_scenes = [
+            (obj_i_r, obj_j_r, direction, camera_config)
+            for direction in directions
+            for obj_i_r, obj_j_r in islice(product(rotations[obj_i], rotations[obj_j]), max_images)
+            for camera_config in camera_configs
+        ]
+        object_combinations.append((obj_i, obj_j, filtered_scenes))
+    # Flatten into one deterministic global list so shards agree on indices,
+    # creating the output directories once per (pair, direction) rather than
+    # re-checking them for every image
+    all_scenes = []
     for obj_i, obj_j, scene_combinations in object_combinations:
-        # Create a top-level directory for this object pair
         overall_combination_prefix = f"{obj_i}_{obj_j}"
         overall_combination_images = os.path.join(config['output_image_dir'], overall_combination_prefix)
         overall_combination_scenes = os.path.join(config['output_scene_dir'], overall_combination_prefix)
-        if not os.path.isdir(overall_combination_images):
-            os.makedirs(overall_combination_images)
-        if not os.path.isdir(overall_combination_scenes):
-            os.makedirs(overall_combination_scenes)
-        for obj_i_r, obj_j_r, direction, camera_config in scene_combinations:
-            # Create a subdirectory for each direction inside the main combination directory
+        direction_dirs = {}
+        for direction in directions:
             direction_dir_images = os.path.join(overall_combination_images, f"{obj_i}_{obj_j}_{direction}")
             direction_dir_scenes = os.path.join(overall_combination_scenes, f"{obj_i}_{obj_j}_{direction}")
-            if not os.path.isdir(direction_dir_images):
-                os.makedirs(direction_dir_images)
-            if not os.path.isdir(direction_dir_scenes):
-                os.makedirs(direction_dir_scenes)
-            img_template_comb = os.path.join(direction_dir_images, prefix + '%06d.png')
-            scene_template_comb = os.path.join(direction_dir_scenes, prefix + '%06d.json')
-            img_path = img_template_comb % image_count
-            scene_path = scene_template_comb % image_count
+            os.makedirs(direction_dir_images, exist_ok=True)
+            os.makedirs(direction_dir_scenes, exist_ok=True)
+            direction_dirs[direction] = (direction_dir_images, direction_dir_scenes)
+        for obj_i_r, obj_j_r, direction, camera_config in scene_combinations:
+            all_scenes.append((direction_dirs[direction], obj_i_r, obj_j_r, direction, camera_config))
+    # A full camera override only applies when every component is given; the
+    # explicit None checks keep legal 0.0 values from being treated as missing
+    if (args.camera_tilt is not None and args.camera_pan is not None
+            and args.camera_height is not None and args.camera_focal_length is not None):
+        camera_settings_override = {
+            'tilt': args.camera_tilt,
+            'pan': args.camera_pan,
+            'height': args.camera_height,
+            'focal_length': args.camera_focal_length
+        }
+    else:
+        camera_settings_override = None
+    # Bind the loop-invariant render arguments once instead of per call
+    render_fn = functools.partial(render_scene_3drf, args, config,
+                                  properties=properties, write_scene=not args.scene_batch)
+    # Render scenes for each combination, keeping only this worker's share.
+    # Scene descriptors go to one JSON-lines file per direction, written as
+    # they are produced through a buffered append handle: appending keeps the
+    # previous run's entries on a resume, and writing per frame means a crash
+    # loses at most the buffered tail rather than every descriptor, which the
+    # resume check could never regenerate once the images exist.
+    batch_files = {}
+    try:
+        for image_count, (direction_dirs, obj_i_r, obj_j_r, direction, camera_config) in enumerate(all_scenes):
+            if image_count % args.shard_count != args.shard_index:
+                continue
+            direction_dir_images, direction_dir_scenes = direction_dirs
+            img_path = os.path.join(direction_dir_images, prefix + '%06d.png') % image_count
+            scene_path = os.path.join(direction_dir_scenes, prefix + '%06d.json') % image_count
+            # Resume support: skip frames whose outputs already exist on disk
+            # (in scene-batch mode only the image is written per frame)
+            if os.path.exists(img_path) and (args.scene_batch or os.path.exists(scene_path)):
+                continue
             print(f"{obj_i_r}\n{obj_j_r}\n{direction}")
-            # Generate a random camera setting for each image
-            if all([args.camera_tilt, args.camera_pan, args.camera_height, args.camera_focal_length]):
-                camera_settings = {
-                    'tilt': args.camera_tilt,
-                    'pan': args.camera_pan,
-                    'height': args.camera_height,
-                    'focal_length': args.camera_focal_length
-                }
-            else:
-                camera_settings = camera_config
-            render_scene_3drf(args, config, camera_settings, properties, image_count, img_path, scene_path, (obj_i_r, obj_j_r), direction)
-            image_count += 1
+            # Use the fixed camera override if given, else this scene's random config
+            camera_settings = camera_settings_override or camera_config
+            scene_struct = render_fn(camera_settings, index=image_count, output_image=img_path,
+                                     output_scene=scene_path, objects=(obj_i_r, obj_j_r), direction=direction)
+            if args.scene_batch and scene_struct is not None:
+                f = batch_files.get(direction_dir_scenes)
+                if f is None:
+                    batch_file = os.path.join(direction_dir_scenes, prefix + 'batch_%d.jsonl' % args.shard_index)
+                    f = open(batch_file, 'a', buffering=1 << 20)
+                    batch_files[direction_dir_scenes] = f
+                f.write(json.dumps(scene_struct) + '\n')
+    finally:
+        for f in batch_files.values():
+            f.close()
 
 def main(args: argparse.Namespace) -> None:
     """
@@ -221,15 +246,10 @@ def main(args: argparse.Namespace) -> None:
     scene_template = prefix + '%06d.json'
     img_template = os.path.join(config['output_image_dir'], img_template)
     scene_template = os.path.join(config['output_scene_dir'], scene_template)
-    config['output_image_dir'] = os.path.abspath(os.path.join(DIR, config['output_image_dir']))
-    config['output_scene_dir'] = os.path.abspath(os.path.join(DIR, config['output_scene_dir']))
-    config['masks_dir'] = os.path.abspath(os.path.join(DIR, config['masks_dir']))
-    if not os.path.isdir(config['output_image_dir']):
-        os.makedirs(config['output_image_dir'])
-    if not os.path.isdir(config['output_scene_dir']):
-        os.makedirs(config['output_scene_dir'])
-    if not os.path.isdir(config['masks_dir']):
-        os.makedirs(config['masks_dir'])
+    # Normalize and create the output directories in one pass
+    for key in ('output_image_dir', 'output_scene_dir', 'masks_dir'):
+        config[key] = os.path.abspath(os.path.join(DIR, config[key]))
+        os.makedirs(config[key], exist_ok=True)
     with open(config['properties_json'], 'r') as f:
         properties = json.load(f)
     if args.objects is None:
@@ -240,21 +260,27 @@ def main(args: argparse.Namespace) -> None:
         camera_configs = generate_camera_configs(args.max_camera_configs)
         render_random_scenes(args, obj_names, properties, camera_configs, config, args.max_images, prefix)
     else:
+        # Imported lazily so `python render_scene.py --help` never loads bpy
+        from render_objaverse import render_scene_3drf
         img_path = os.path.join(config['output_image_dir'], prefix + '.png')
         scene_path = os.path.join(config['output_scene_dir'], prefix + '.json')
-        directions = ["front", "right", "behind", "left"]
         assert len(obj_names) == 2
         ground_name, figure_name = obj_names
         ground = properties[ground_name]
         figure = properties[figure_name]
-        ground['rotation'] = math.radians(args.object1_rotation if args.object1_rotation is not None else 0)
-        figure['rotation'] = math.radians(args.object2_rotation if args.object2_rotation is not None else 0)
-        if ground['default_orientation']:
-            ground['orientation'] = directions[(directions.index(properties[ground_name]['default_orientation']) + round(args.object1_rotation / 90)) % 4]
+        # Hoist the rotation values and quarter-turn offsets, computed once each
+        ground_rotation = args.object1_rotation if args.object1_rotation is not None else 0
+        figure_rotation = args.object2_rotation if args.object2_rotation is not None else 0
+        ground['rotation'] = math.radians(ground_rotation)
+        figure['rotation'] = math.radians(figure_rotation)
+        ground_orientation = ground['default_orientation']
+        figure_orientation = figure['default_orientation']
+        if ground_orientation:
+            ground['orientation'] = directions[(DIRECTION_INDEX[ground_orientation] + round(ground_rotation / 90)) % 4]
         else:
             ground['orientation'] = None
-        if figure['default_orientation']:
-            figure['orientation'] = directions[(directions.index(properties[figure_name]['default_orientation']) + round(args.object2_rotation / 90)) % 4]
+        if figure_orientation:
+            figure['orientation'] = directions[(DIRECTION_INDEX[figure_orientation] + round(figure_rotation / 90)) % 4]
         else:
             figure['orientation'] = None
         direction = args.direction
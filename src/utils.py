@@ -1,9 +1,14 @@
 """Utility functions for rendering scenes in Blender."""
+import collections
 import os
 import sys
 import bpy
+from mathutils import Matrix
 from typing import List
 
+# Number of objects added so far per base name, to generate unique names in O(1)
+_object_counts = collections.defaultdict(int)
+
 def extract_args(input_argv: str = None) -> List[str]:
     """Pull out command-line arguments after '--'.
 
@@ -31,11 +36,12 @@ def add_object(object_dir: str, name: str, scale: float, loc: tuple[float, float
         theta: optional rotation of the object about the z-axis
     """
     # First figure out how many of this object are already in the scene so we can
-    # give the new object a unique name
-    count = 0
-    for obj in bpy.data.objects:
-        if obj.name.startswith(name):
-            count += 1
+    # give the new object a unique name. Seed the counter lazily in case other
+    # code already added objects with this prefix.
+    if name not in _object_counts:
+        _object_counts[name] = sum(1 for obj in bpy.data.objects if obj.name.startswith(name))
+    count = _object_counts[name]
+    _object_counts[name] += 1
 
     filename = os.path.join(object_dir, '%s.blend' % name, 'Object', name)
     bpy.ops.wm.append(filename=filename)
@@ -44,9 +50,11 @@ def add_object(object_dir: str, name: str, scale: float, loc: tuple[float, float
     new_name = '%s_%d' % (name, count)
     bpy.data.objects[name].name = new_name
 
-    # Set the new object as active, then rotate, scale, and translate it
+    # Compose translation, rotation, and scale into a single matrix and assign
+    # it once, letting Blender's C core decompose it on the next evaluation
     x, y = loc
-    bpy.context.view_layer.objects.active = bpy.data.objects[new_name]
-    bpy.context.object.rotation_euler[2] = theta
-    bpy.ops.transform.resize(value=(scale, scale, scale))
-    bpy.ops.transform.translate(value=(x, y, scale))
+    bpy.data.objects[new_name].matrix_world = (
+        Matrix.Translation((x, y, scale))
+        @ Matrix.Rotation(theta, 4, 'Z')
+        @ Matrix.Diagonal((scale, scale, scale, 1.0))
+    )